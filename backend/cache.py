@@ -0,0 +1,179 @@
+import os
+import json
+import hashlib
+from functools import wraps
+
+import redis
+from flask import current_app, request
+
+redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+# Short timeouts so an unreachable Redis host makes the endpoints fall
+# back to the database instead of hanging
+redis_pool = redis.ConnectionPool.from_url(redis_url,
+                                           socket_connect_timeout=0.5,
+                                           socket_timeout=0.5)
+r = redis.Redis(connection_pool=redis_pool)
+
+CACHE_MAX_AGE = 30
+
+# Tag sets expire too, so they cannot grow without bound between writes.
+# This must be at least the longest TTL of any tagged key
+TAG_TTL = 300
+
+
+# Keys are namespaced by database so that e.g. the test suite never reads
+# values cached by a server running against another database
+def key_prefix():
+    database = current_app.config["SQLALCHEMY_DATABASE_URI"].\
+        rsplit("/", 1)[-1]
+    return f"trivia:{database}:"
+
+
+def cache_key(path, page):
+    return f"{key_prefix()}{path}?page={page}"
+
+
+def tag_key(tag):
+    return f"{key_prefix()}tags:{tag}"
+
+
+'''
+conditional_response(response, etag)
+    tags a successful response with its ETag and answers 304 Not Modified
+    when the client already holds that version
+'''
+
+
+def conditional_response(response, etag):
+    if response.status_code != 200:
+        return response
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={CACHE_MAX_AGE}"
+    return response
+
+
+'''
+cache_response(ttl, tags)
+    caches the status, headers, body and ETag of a GET view in a redis
+    hash keyed by route + page number. The key is added to a set for
+    every tag so that mutations can invalidate all responses depending on
+    it. If redis is unreachable the view is called directly.
+'''
+
+
+def cache_response(ttl, tags=()):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Other query arguments are ignored so that arbitrary URLs
+            # cannot each create a new key
+            page = max(request.args.get("page", default=1, type=int), 1)
+            key = cache_key(request.path, page)
+
+            try:
+                cached = r.hgetall(key)
+            except redis.exceptions.RedisError:
+                cached = None
+
+            # Cache hits answer the ETag check without touching the database.
+            # Entries stored before ETags were added count as misses and
+            # are overwritten below
+            etag = cached.get(b"etag") if cached else None
+            if etag is not None:
+                response = current_app.response_class(
+                    cached[b"body"],
+                    status=int(cached[b"status"]),
+                    headers=json.loads(cached[b"headers"]))
+                return conditional_response(response, etag.decode())
+
+            response = current_app.make_response(view(*args, **kwargs))
+            etag = hashlib.md5(response.get_data()).hexdigest()
+
+            # Server errors are never cached, 404s are
+            if cached is not None and response.status_code < 500:
+                try:
+                    pipe = r.pipeline()
+                    pipe.hset(key, mapping={
+                        "body": response.get_data(),
+                        "status": response.status_code,
+                        "headers": json.dumps(list(response.headers.items())),
+                        "etag": etag
+                    })
+                    pipe.expire(key, ttl)
+                    for tag in tags:
+                        pipe.sadd(tag_key(tag), key)
+                        pipe.expire(tag_key(tag), max(ttl, TAG_TTL))
+                    pipe.execute()
+                except redis.exceptions.RedisError:
+                    pass
+
+            return conditional_response(response, etag)
+        return wrapper
+    return decorator
+
+
+'''
+cached_value(key, ttl, compute, tags)
+    returns the integer stored under the key, calling compute() and
+    storing its result on a miss
+'''
+
+
+def cached_value(key, ttl, compute, tags=()):
+    key = f"{key_prefix()}{key}"
+
+    try:
+        cached = r.get(key)
+    except redis.exceptions.RedisError:
+        return compute()
+
+    if cached is not None:
+        return int(cached)
+
+    value = compute()
+
+    try:
+        pipe = r.pipeline()
+        pipe.setex(key, ttl, value)
+        for tag in tags:
+            pipe.sadd(tag_key(tag), key)
+            pipe.expire(tag_key(tag), max(ttl, TAG_TTL))
+        pipe.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+    return value
+
+
+'''
+invalidate(tag)
+    deletes every cached response and value registered under the tag
+'''
+
+
+def invalidate(tag):
+    try:
+        keys = r.smembers(tag_key(tag))
+        r.delete(tag_key(tag), *keys)
+    except redis.exceptions.RedisError:
+        pass
+
+
+'''
+clear()
+    deletes every key cached for the current database
+'''
+
+
+def clear():
+    try:
+        keys = list(r.scan_iter(f"{key_prefix()}*"))
+        if keys:
+            r.delete(*keys)
+    except redis.exceptions.RedisError:
+        pass
@@ -1,81 +1,153 @@
 import os
-from flask import Flask, request, abort, jsonify
-from sqlalchemy import exc
+import json
+from math import ceil
+from time import time
+import orjson
+from flask import Flask, request, abort, current_app
+from sqlalchemy import exc, func, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import aliased
 from flask_cors import CORS
-from random import choice
 from models import *
 
 from models import setup_db, Question, Category
+from cache import cache_response, cached_value, invalidate
+from schemas import QuestionInput, QuizInput, ValidationError
 
 QUESTIONS_PER_PAGE = 10
+CATEGORIES_TTL = 60
+SEARCH_RESULTS_LIMIT = 100
+
+
+# Baked queries are compiled to SQL once and reused with new parameters
+bakery = baked.bakery()
+
+categories_query = bakery(lambda session: session.query(Category))
+
+category_id_query = bakery(lambda session: session.query(Category.id))
+category_id_query += lambda q: q.filter(
+    Category.id == bindparam("category_id"))
+
+questions_count_query = bakery(
+    lambda session: session.query(func.count(Question.id)))
+
+questions_page_query = bakery(
+    lambda session: session.query(*Question.columns()))
+questions_page_query += lambda q: q.order_by(Question.id).\
+    offset(bindparam("offset")).limit(bindparam("limit"))
+
+category_questions_query = bakery(
+    lambda session: session.query(*Question.columns()))
+category_questions_query += lambda q: q.filter(
+    Question.category_id == bindparam("category_id"))
+
+search_questions_query = bakery(
+    lambda session: session.query(*Question.columns()))
+search_questions_query += lambda q: q.filter(
+    Question.question.ilike(bindparam("search_term"))).\
+    order_by(Question.id).limit(bindparam("limit"))
+
+
+# Drop-in for flask.jsonify that encodes straight to bytes with orjson.
+# Request bodies echoed back may hold integers beyond the 64-bit range
+# orjson supports, which fall back to the stdlib encoder
+def fast_jsonify(data):
+    try:
+        body = orjson.dumps(data)
+    except TypeError:
+        body = json.dumps(data)
+
+    return current_app.response_class(body, mimetype="application/json")
+
+
+# Categories rarely change, so each process keeps its own copy for
+# CATEGORIES_TTL seconds instead of querying them on every page load
+_categories_cache = {"at": 0, "data": None}
+
+
+def get_cached_categories():
+    if (_categories_cache["data"] is None
+            or time() - _categories_cache["at"] >= CATEGORIES_TTL):
+        categories = categories_query(db.session()).all()
+        _categories_cache["data"] = [category.format()
+                                     for category in categories]
+        _categories_cache["at"] = time()
+
+    return _categories_cache["data"]
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
     setup_db(app)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
-
-    @app.after_request
-    def after_request(response):
-        response.headers.add("Access-Control-Allow-Headers",
-                             "Content-Type, Authorization")
-        response.headers.add("Access-Control-Allow-Headers",
-                             "GET, POST, PATCH, DELETE, PUT")
-        return response
+    CORS(app, resources={r"/api/*": {"origins": "*"}},
+         allow_headers=["Content-Type", "Authorization"],
+         methods=["GET", "POST", "PATCH", "DELETE", "PUT"])
 
     # GET Requests
     # ________________________________________________________________________
 
     @app.route("/api/v1/categories", methods=["GET"])
+    @cache_response(ttl=300)
     def get_categories():
-        categories = db.session.query(Category).all()
-        category_list = [category.format() for category in categories]
+        category_list = get_cached_categories()
 
-        return jsonify({"categories": category_list,
-                        "success": True}), 200
+        return fast_jsonify({"categories": category_list,
+                             "success": True}), 200
 
     @app.route("/api/v1/questions", methods=["GET"])
+    @cache_response(ttl=30, tags=("questions",))
     def get_questions():
-        page = request.args.get("page", default=1, type=int)
+        # Pages below 1 are read as the first page, as paginate() did
+        page = max(request.args.get("page", default=1, type=int), 1)
+
+        # The total only changes on insert/delete, so it is cached rather
+        # than counted on every page load
+        total_questions = cached_value(
+            "questions:total", 30,
+            lambda: questions_count_query(db.session()).scalar(),
+            tags=("questions",))
+        pages = ceil(total_questions / QUESTIONS_PER_PAGE)
+
+        if page > pages and page > 1:
+            abort(404)
 
-        # questions.items is used to create questions_list
-        questions = db.session.query(Question).paginate(page,
-                                                        QUESTIONS_PER_PAGE,
-                                                        False)
-        questions_list = [question.format() for question in questions.items]
+        questions = questions_page_query(db.session()).\
+            params(offset=(page - 1) * QUESTIONS_PER_PAGE,
+                   limit=QUESTIONS_PER_PAGE).all()
+        questions_list = [Question.format_row(row) for row in questions]
 
-        categories = db.session.query(Category).all()
-        category_list = [category.format() for category in categories]
+        category_list = get_cached_categories()
 
-        if page > questions.pages and page > 1:
-            abort(404)
-
-        return jsonify({"questions": questions_list,
-                        "categories": category_list,
-                        "current_category": None,
-                        "success": True,
-                        "total_questions": questions.total}), 200
+        return fast_jsonify({"questions": questions_list,
+                             "categories": category_list,
+                             "current_category": None,
+                             "success": True,
+                             "total_questions": total_questions}), 200
 
     @app.route("/api/v1/categories/<int:category_id>/questions")
+    @cache_response(ttl=30, tags=("questions",))
     def get_questions_by_category(category_id):
 
-        category = db.session.query(Category).\
-            filter(Category.id == category_id).first()
+        category = category_id_query(db.session()).\
+            params(category_id=category_id).first()
 
         # Creates exception if category_id does not exist
         if category is None:
-            return jsonify({"category_id": category_id,
-                            "success": False,
-                            "status": 404,
-                            "message": "The category specified in the URL "
-                                       "doesn't exist. Please resubmit with "
-                                       "a correct category id."}), 404
-
-        questions = category.questions
-        questions_list = [question.format() for question in questions]
-
-        return jsonify({
+            return fast_jsonify({"category_id": category_id,
+                                 "success": False,
+                                 "status": 404,
+                                 "message": "The category specified in "
+                                            "the URL doesn't exist. Please "
+                                            "resubmit with a correct "
+                                            "category id."}), 404
+
+        questions = category_questions_query(db.session()).\
+            params(category_id=category_id).all()
+        questions_list = [Question.format_row(row) for row in questions]
+
+        return fast_jsonify({
             "questions": questions_list,
             "total_questions": len(questions_list),
             "current_category": category_id,
@@ -87,23 +159,25 @@ def create_app(test_config=None):
 
     @app.route("/api/v1/questions/<int:question_id>", methods=["DELETE"])
     def delete_question(question_id):
-        question = db.session.query(Question).\
-            filter(Question.id == question_id).first()
+        question = db.session.query(Question).get(question_id)
 
         if question is None:
-            return jsonify({"question_id": question_id,
-                            "success": False,
-                            "status": 404,
-                            "message": "The question specified in the URL"
-                                       " doesn't exist. Please resubmit with "
-                                       "a correct question id"}), 404
+            return fast_jsonify({"question_id": question_id,
+                                 "success": False,
+                                 "status": 404,
+                                 "message": "The question specified in "
+                                            "the URL doesn't exist. Please "
+                                            "resubmit with a correct "
+                                            "question id"}), 404
         try:
             Question.delete(question)
         except exc.SQLAlchemyError as e:
-            return jsonify({"question_id": question_id,
-                            "success": False,
-                            "status": 422,
-                            "message": f"{e.orig}"}), 422
+            return fast_jsonify({"question_id": question_id,
+                                 "success": False,
+                                 "status": 422,
+                                 "message": f"{e.orig}"}), 422
+
+        invalidate("questions")
 
         return app.response_class(status=204)
 
@@ -115,22 +189,34 @@ def create_app(test_config=None):
 
         body = request.get_json()
 
+        # Rejects bodies the questions table would refuse before touching
+        # the database
+        try:
+            question_input = QuestionInput.parse_obj(body)
+        except ValidationError as e:
+            return fast_jsonify({"question_input": body,
+                                 "success": False,
+                                 "status": 422,
+                                 "message": f"{e}"}), 422
+
         try:
             new_question = Question(
-                question=body.get("question", None),
-                answer=body.get("answer", None),
-                category_id=body.get("category_id", None),
-                difficulty=body.get("difficulty", None)
+                question=question_input.question,
+                answer=question_input.answer,
+                category_id=question_input.category_id,
+                difficulty=question_input.difficulty
             )
 
             Question.insert(new_question)
         except exc.SQLAlchemyError as e:
-            return jsonify({"question_input": body,
-                            "success": False,
-                            "status": 422,
-                            "message": f"{e.orig}"}), 422
+            return fast_jsonify({"question_input": body,
+                                 "success": False,
+                                 "status": 422,
+                                 "message": f"{e.orig}"}), 422
 
-        return jsonify({
+        invalidate("questions")
+
+        return fast_jsonify({
             "question_input": body,
             "success": True,
             "status": 201,
@@ -142,14 +228,19 @@ def create_app(test_config=None):
 
         search_term = request.get_json().get("search_term")
 
-        if search_term is None:
+        # Terms shorter than two characters match nearly every question
+        if not isinstance(search_term, str) or len(search_term) < 2:
             abort(400)
 
-        questions = db.session.query(Question)\
-            .filter(Question.question.ilike("%" + search_term + "%")).all()
-        question_list = [question.format() for question in questions]
+        limit = request.args.get("limit", default=SEARCH_RESULTS_LIMIT,
+                                 type=int)
+        limit = max(1, min(limit, SEARCH_RESULTS_LIMIT))
+
+        questions = search_questions_query(db.session()).\
+            params(search_term="%" + search_term + "%", limit=limit).all()
+        question_list = [Question.format_row(row) for row in questions]
 
-        return jsonify({
+        return fast_jsonify({
             "questions": question_list,
             "total_questions": len(question_list),
             "current_category": None,
@@ -159,58 +250,70 @@ def create_app(test_config=None):
     @app.route("/api/v1/quizzes", methods=["POST"])
     def play_quizzes():
 
-        body = request.get_json()
-
-        previous_questions = body.get("previous_questions", None)
-        quiz_category_type = body.get("quiz_category", None)
-
-        if previous_questions is None:
-            abort(422)
-        if quiz_category_type is None:
+        try:
+            quiz = QuizInput.parse_obj(request.get_json())
+        except ValidationError:
             abort(422)
 
-        # Filters out the available question ids based on previous questions
+        # Repeated ids are dropped once here so the array sent to the
+        # database stays as small as the number of distinct questions
+        prev_set = frozenset(quiz.previous_questions)
+
+        # Builds the candidate id query in SQL. It selects only ids from an
+        # alias of questions so that Postgres can answer it from the
+        # (category_id, id) index without reading the table, and so it is
+        # not correlated with the outer query that fetches the question
         # The "click" type is for the ALL category
-        if quiz_category_type['id'] == 0:
-            ids = db.session.query(Question.id).all()
-            filtered_ids = [i.id for i in ids if i.id not in previous_questions]
-        else:
-            quiz_category_id = quiz_category_type['id']
-
-            quiz_category_query_check = db.session.query(Category.id).\
-                filter(Category.id == quiz_category_id).first()
+        quiz_category_id = quiz.quiz_category.id
+        candidate = aliased(Question)
+        candidate_ids = db.session.query(candidate.id)
+        total = db.session.query(func.count(Question.id))
+
+        if quiz_category_id != 0:
+            quiz_category_query_check = category_id_query(db.session()).\
+                params(category_id=quiz_category_id).first()
             if quiz_category_query_check is None:
                 abort(422)
 
-            ids = db.session.query(Question.id) \
-                .filter(Question.category_id == quiz_category_id).all()
-            filtered_ids = [i.id for i in ids if i.id not in previous_questions]
-
-        # Checks if there are no filtered ids before returning a response
-        # No more filtered ids means its the end of the quiz
-        if len(filtered_ids) == 0:
-            questions_per_play = min(5, len(ids))
-            return jsonify({"question": None,
-                            "questions_per_play": questions_per_play,
-                            "success": True,
-                            "status": 200}), 200
-        else:
-            questions_per_play = min(5, len(ids))
-            question_id = choice(filtered_ids)
-            question = db.session.query(Question).\
-                filter(Question.id == question_id).first()
-
-            return jsonify({"question": Question.format(question),
-                            "questions_per_play": questions_per_play,
-                            "success": True,
-                            "status": 200}), 200
+            candidate_ids = candidate_ids.\
+                filter(candidate.category_id == quiz_category_id)
+            total = total.filter(Question.category_id == quiz_category_id)
+
+        # The category total only changes on insert/delete
+        questions_per_play = min(5, cached_value(
+            f"questions:total:{quiz_category_id}", 300, total.scalar,
+            tags=("questions",)))
+
+        # Binds previous_questions as one int[] parameter rather than an IN
+        # list that grows with every question answered
+        candidate_ids = candidate_ids.filter(~(candidate.id == any_(
+            bindparam("previous_questions", list(prev_set),
+                      type_=ARRAY(Integer)))))
+
+        # Only the randomly picked row is read from the table
+        random_id = candidate_ids.order_by(func.random()).limit(1).\
+            as_scalar()
+        question = db.session.query(Question).\
+            filter(Question.id == random_id).first()
+
+        # No question left means its the end of the quiz
+        if question is None:
+            return fast_jsonify({"question": None,
+                                 "questions_per_play": questions_per_play,
+                                 "success": True,
+                                 "status": 200}), 200
+
+        return fast_jsonify({"question": Question.format(question),
+                             "questions_per_play": questions_per_play,
+                             "success": True,
+                             "status": 200}), 200
 
     # Error Handlers
     # ____________________________________________________________________________________________________
 
     @app.errorhandler(400)
     def get_400_error(error):
-        return jsonify({
+        return fast_jsonify({
             "success": False,
             "status": 400,
             "message": error.description
@@ -218,7 +321,7 @@ def create_app(test_config=None):
 
     @app.errorhandler(404)
     def get_404_error(error):
-        return jsonify({
+        return fast_jsonify({
             "success": False,
             "status": 404,
             "message": error.description
@@ -226,7 +329,7 @@ def create_app(test_config=None):
 
     @app.errorhandler(422)
     def get_422_error(error):
-        return jsonify({
+        return fast_jsonify({
             "success": False,
             "status": 422,
             "message": "The json that was sent did not include a proper field. "
@@ -235,7 +338,7 @@ def create_app(test_config=None):
 
     @app.errorhandler(500)
     def get_500_error(error):
-        return jsonify({
+        return fast_jsonify({
             "success": False,
             "status": 500,
             "message": error.description
@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+
+workers = int(os.environ.get("GUNICORN_WORKERS",
+                             multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gevent"
+worker_connections = 500
+
+# Each worker holds its own engine, so the pool is kept small to keep
+# workers * (pool_size + max_overflow) under Postgres' max_connections
+raw_env = [
+    "SQLALCHEMY_POOL_SIZE=" + os.environ.get("SQLALCHEMY_POOL_SIZE", "5"),
+    "SQLALCHEMY_MAX_OVERFLOW=" + os.environ.get("SQLALCHEMY_MAX_OVERFLOW",
+                                                "5")
+]
+
+
+def post_fork(server, worker):
+    # psycopg2 is a C extension, so gevent's monkey patching does not make
+    # its socket waits cooperative on its own
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
@@ -0,0 +1,28 @@
+"""add trigram index on questions.question
+
+Revision ID: 3f1a6c2b9d04
+Revises: 
+Create Date: 2020-10-15 10:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a6c2b9d04'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lets the ILIKE '%term%' filter in search_questions use an index
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('questions_question_trgm', 'questions', ['question'],
+                    postgresql_using='gin',
+                    postgresql_ops={'question': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('questions_question_trgm', table_name='questions')
@@ -0,0 +1,27 @@
+"""add covering index on questions.category_id
+
+Revision ID: 8b2e4d71c5a9
+Revises: 3f1a6c2b9d04
+Create Date: 2020-10-15 14:37:05.524871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d71c5a9'
+down_revision = '3f1a6c2b9d04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Covers the id-only candidate subquery in play_quizzes when it filters
+    # by category. Superseded by ix_questions_cat_id in c47d90e3a218
+    op.execute("CREATE INDEX ix_questions_category_id "
+               "ON questions (category_id) INCLUDE (id)")
+
+
+def downgrade():
+    op.drop_index('ix_questions_category_id', table_name='questions')
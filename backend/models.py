@@ -1,5 +1,6 @@
 import os
 from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy.pool import NullPool, QueuePool
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 import json
@@ -9,6 +10,28 @@ database_path = "postgres://postgres:password@{}/{}".format('localhost:5432', da
 
 db = SQLAlchemy()
 
+'''
+engine_options()
+    connection pool settings for the engine. SQLALCHEMY_POOLCLASS=NullPool
+    opens a new connection per checkout for deployments where holding
+    connections open hurts (e.g. short-lived workers)
+'''
+
+
+def engine_options():
+    if os.environ.get("SQLALCHEMY_POOLCLASS") == "NullPool":
+        return {"poolclass": NullPool}
+
+    return {
+        "poolclass": QueuePool,
+        "pool_size": int(os.environ.get("SQLALCHEMY_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("SQLALCHEMY_MAX_OVERFLOW", 20)),
+        "pool_timeout": 30,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800
+    }
+
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
@@ -18,6 +41,7 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
     db.app = app
     db.init_app(app)
     db.create_all()
@@ -65,6 +89,23 @@ class Question(db.Model):
             'difficulty': self.difficulty
         }
 
+    # Column-level counterparts of format() for list endpoints, which skip
+    # building ORM instances for every row
+    @classmethod
+    def columns(cls):
+        return (cls.id, cls.question, cls.answer, cls.category_id,
+                cls.difficulty)
+
+    @staticmethod
+    def format_row(row):
+        return {
+            'id': row.id,
+            'question': row.question,
+            'answer': row.answer,
+            'category_id': row.category_id,
+            'difficulty': row.difficulty
+        }
+
 
 '''
 Category
@@ -0,0 +1,47 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, StrictInt, ValidationError, conint, validator
+
+'''
+QuestionInput
+    body of POST /api/v1/questions. Mirrors the questions table, where
+    only category_id is required and integers are Postgres int4
+'''
+
+Int4 = conint(ge=-2 ** 31, le=2 ** 31 - 1)
+
+
+class QuestionInput(BaseModel):
+    question: Optional[str] = None
+    answer: Optional[str] = None
+    category_id: Int4
+    difficulty: Optional[Int4] = None
+
+
+'''
+QuizInput
+    body of POST /api/v1/quizzes. The frontend sends category ids as
+    numeric strings, which are accepted, but only the integer 0 selects
+    the ALL category: "0" is rejected like any unknown category
+'''
+
+
+class QuizCategory(BaseModel):
+    id: int
+
+    @validator("id", pre=True)
+    def parse_id(cls, value):
+        if isinstance(value, str):
+            if not value.isdigit() or int(value) == 0:
+                raise ValueError("not a category id")
+            return int(value)
+
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError("not a category id")
+
+        return value
+
+
+class QuizInput(BaseModel):
+    previous_questions: List[StrictInt]
+    quiz_category: QuizCategory
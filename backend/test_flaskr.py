@@ -1,63 +1,91 @@
 import os
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, SEARCH_RESULTS_LIMIT
+from models import setup_db, db, Question, Category
+import cache
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
-    def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}:{}@{}/{}".format('postgres', 'password', 'localhost:5432',
-                                                             self.database_name)
-        setup_db(self.app, self.database_path)
+    @classmethod
+    def setUpClass(cls):
+        """Initialize app and seed the test database once."""
+        cls.app = create_app()
+        cls.database_name = "trivia_test"
+        cls.database_path = "postgres://{}:{}@{}/{}".format('postgres', 'password', 'localhost:5432',
+                                                            cls.database_name)
+        setup_db(cls.app, cls.database_path)
 
         # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
+        with cls.app.app_context():
             # create all tables
-            self.db.create_all()
+            db.create_all()
 
             # cleans database before adding new records
-            self.db.session.query(Question).delete()
-            self.db.session.commit()
-            self.db.session.query(Category).delete()
-            self.db.session.commit()
+            db.session.query(Question).delete()
+            db.session.query(Category).delete()
+            db.session.commit()
 
             # adds categories
-            self.db.engine.execute("insert into categories (id, type) "
-                                   "values (1, 'Animals')")
-            self.db.engine.execute("insert into categories (id, type) "
-                                   "values (2, 'Math');")
-            self.db.engine.execute("insert into categories (id, type) "
-                                   "values (3, 'Science');")
-            self.db.engine.execute("insert into categories (id, type) "
-                                   "values (4, 'Disney');")
-            self.db.engine.execute("insert into categories (id, type) "
-                                   "values (5, 'Sci-Fi');")
+            db.engine.execute("insert into categories (id, type) "
+                              "values (1, 'Animals'), (2, 'Math'), "
+                              "(3, 'Science'), (4, 'Disney'), (5, 'Sci-Fi');")
 
             # adds a row to be deleted in the "test_delete_question" function
-            self.db.engine.execute(
+            # and a row to be searched in the "test_search_questions" function
+            db.engine.execute(
                 "insert into questions (id, question, answer, category_id, difficulty) "
-                "values (1, '2+2', '4', 2, 4);")
+                "values (1, '2+2', '4', 2, 4), "
+                "(2, 'What country borders the US to the North?', 'Canada', 2, 4);")
 
-            # adds a row to be searched in the "test_search_questions" function
-            self.db.engine.execute(
-                "insert into questions (id, question, answer, category_id, difficulty) "
-                "values (2, 'What country borders the US to the North?', 'Canada', 2, 4);")
+            # rows inserted without an id must not collide with the seeds
+            db.engine.execute("select setval('questions_id_seq', "
+                              "(select max(id) from questions));")
+
+    def setUp(self):
+        """Run each test inside a transaction that is rolled back afterwards."""
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        # rolled back writes never invalidate the cache, so start clean
+        cache.clear()
+
+        self.connection = db.engine.connect()
+        self.trans = self.connection.begin()
 
+        # the app's commits only release a SAVEPOINT inside the outer
+        # transaction, and a failed commit only rolls back to it
+        self.session = db.session
+        db.session = db.create_scoped_session(
+            options={"bind": self.connection, "binds": {}})
+        db.session.begin_nested()
+        event.listen(db.session(), "after_transaction_end",
+                     self.restart_savepoint)
+
+        # closing the session after each request would end the SAVEPOINT
+        db.session.remove = lambda: None
+
+    @staticmethod
+    def restart_savepoint(session, transaction):
+        if transaction.nested and not transaction._parent.nested:
+            session.expire_all()
+            session.begin_nested()
 
     def tearDown(self):
         """Executed after each test"""
-        pass
+        event.remove(db.session(), "after_transaction_end",
+                     self.restart_savepoint)
+        db.session.close()
+        db.session = self.session
+
+        self.trans.rollback()
+        self.connection.close()
+        self.app_context.pop()
 
     # GET Requests
     # ______________________________________________________________________
@@ -69,6 +97,17 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertGreaterEqual(len(data['categories']), 0)
 
+    def test_304_get_categories_not_modified(self):
+        res = self.client().get('/api/v1/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/api/v1/categories',
+                                headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(res.data, b'')
+
     def test_405_sent_not_allowed_method(self):
         res = self.client().post('/api/v1/categories')
 
@@ -90,6 +129,14 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 404)
 
+    def test_get_questions_page_below_one(self):
+        res = self.client().get('/api/v1/questions?page=-3')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['questions']), 2)
+
     def test_get_questions_by_category(self):
         res = self.client().get('/api/v1/categories/1/questions')
         data = json.loads(res.data)
@@ -140,6 +187,40 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["status"], 201)
         self.assertEqual(data["message"], "The question was added to the database")
 
+    def test_post_new_question_invalidates_cached_questions(self):
+        res = self.client().get('/api/v1/questions')
+        total_questions = json.loads(res.data)['total_questions']
+
+        json_input = {
+            "question": "3+3",
+            "answer": "6",
+            "category_id": 2,
+            "difficulty": 1
+        }
+        res = self.client().post('/api/v1/questions', json=json_input)
+        self.assertEqual(res.status_code, 201)
+
+        res = self.client().get('/api/v1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['total_questions'], total_questions + 1)
+
+    def test_delete_question_invalidates_cached_quiz_total(self):
+        json_input = {
+            "previous_questions": [],
+            "quiz_category": {"type": "Math", "id": 2}
+        }
+        res = self.client().post('/api/v1/quizzes', json=json_input)
+        self.assertEqual(json.loads(res.data)['questions_per_play'], 2)
+
+        res = self.client().delete('/api/v1/questions/1')
+        self.assertEqual(res.status_code, 204)
+
+        res = self.client().post('/api/v1/quizzes', json=json_input)
+        data = json.loads(res.data)
+
+        self.assertEqual(data['questions_per_play'], 1)
+
     def test_422_post_incomplete_json(self):
         json_input = {
             "question": "2+2",
@@ -155,6 +236,23 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["status"], 422)
         self.assertGreaterEqual(len(data["message"]), 0)
 
+    def test_422_post_difficulty_out_of_range(self):
+        json_input = {
+            "question": "2+2",
+            "answer": "4",
+            "category_id": 1,
+            "difficulty": 100000000000000000000
+        }
+        count = db.session.query(Question).count()
+        res = self.client().post('/api/v1/questions', json=json_input)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(db.session.query(Question).count(), count)
+        self.assertEqual(data["question_input"]["difficulty"],
+                         100000000000000000000)
+
     def test_search_questions(self):
         json_input = {
             "search_term": "country"
@@ -179,6 +277,50 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['status'], 400)
         self.assertGreaterEqual(len(data['message']), 0)
 
+    def test_400_search_term_too_short(self):
+        json_input = {
+            "search_term": "a"
+        }
+        res = self.client().post('/api/v1/questions/search', json=json_input)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['status'], 400)
+
+    def test_400_search_term_not_a_string(self):
+        json_input = {
+            "search_term": 42
+        }
+        res = self.client().post('/api/v1/questions/search', json=json_input)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['status'], 400)
+
+    def test_search_questions_limit(self):
+        # more matching rows than the cap, rolled back in tearDown
+        db.session.add_all([Question(f"Limit question {i}", "answer", 1, 1)
+                            for i in range(SEARCH_RESULTS_LIMIT + 1)])
+        db.session.commit()
+        json_input = {
+            "search_term": "Limit question"
+        }
+
+        res = self.client().post('/api/v1/questions/search?limit=1',
+                                 json=json_input)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 1)
+
+        res = self.client().post('/api/v1/questions/search', json=json_input)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), SEARCH_RESULTS_LIMIT)
+
     '''
         Testing the play_quiz endpoint
     '''
@@ -240,6 +382,46 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['status'], 422)
         self.assertGreaterEqual(len(data['message']), 0)
 
+    def test_play_quiz_string_category_id(self):
+        json_input = {
+            "previous_questions": [1],
+            "quiz_category": {"type": {"id": 2,
+                                       "type": "Math"},
+                             "id": "2"}
+        }
+        res = self.client().post('/api/v1/quizzes', json=json_input)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], 2)
+        self.assertEqual(data['questions_per_play'], 2)
+        self.assertEqual(data['success'], True)
+
+    def test_422_non_json_play_quiz(self):
+        res = self.client().post('/api/v1/quizzes', data='not json',
+                                 content_type='text/plain')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['status'], 422)
+
+    def test_422_post_bad_difficulty(self):
+        json_input = {
+            "question": "2+2",
+            "answer": "4",
+            "category_id": 1,
+            "difficulty": "abc"
+        }
+        count = db.session.query(Question).count()
+        res = self.client().post('/api/v1/questions', json=json_input)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["status"], 422)
+        self.assertEqual(db.session.query(Question).count(), count)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":